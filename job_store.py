@@ -0,0 +1,134 @@
+import json
+import os
+import time
+
+import redis.asyncio as redis
+
+# Active jobs live for a day; finished ones only long enough for clients to fetch the result
+JOB_TTL = 24 * 60 * 60  # seconds
+FINISHED_JOB_TTL = 60 * 60  # seconds
+FINISHED_STATUSES = {"completed", "failed"}
+
+# Update an existing job hash and reset its TTL for the resulting status, in one
+# step so a job that expires meanwhile is not recreated as a partial record.
+# ARGV: active TTL, finished TTL, JSON list of finished statuses, then field/value pairs.
+_UPDATE_SCRIPT = """
+if redis.call("EXISTS", KEYS[1]) == 0 then
+    return 0
+end
+redis.call("HSET", KEYS[1], unpack(ARGV, 4))
+local finished = {}
+for _, status in ipairs(cjson.decode(ARGV[3])) do
+    finished[status] = true
+end
+local status = redis.call("HGET", KEYS[1], "status")
+local ttl = ARGV[1]
+if status and finished[cjson.decode(status)] then
+    ttl = ARGV[2]
+end
+redis.call("EXPIRE", KEYS[1], ttl)
+return 1
+"""
+
+
+class RedisJobStore:
+    """
+    Job records stored as Redis hashes, shared by every uvicorn worker
+
+    Each field is JSON-encoded so nested values (input_data) and None round-trip.
+    """
+
+    def __init__(self, url):
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self._update_script = self.redis.register_script(_UPDATE_SCRIPT)
+
+    async def get(self, job_id):
+        fields = await self.redis.hgetall(self._key(job_id))
+        if not fields:
+            return None
+        return {name: json.loads(value) for name, value in fields.items()}
+
+    async def create(self, job_id, **fields):
+        key = self._key(job_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping={name: json.dumps(value) for name, value in fields.items()})
+            pipe.expire(key, _ttl_for(fields.get("status")))
+            await pipe.execute()
+
+    async def update(self, job_id, **fields):
+        # Returns False, writing nothing, when the job does not exist (or expired)
+        args = [JOB_TTL, FINISHED_JOB_TTL, json.dumps(sorted(FINISHED_STATUSES))]
+        for name, value in fields.items():
+            args += [name, json.dumps(value)]
+        return bool(await self._update_script(keys=[self._key(job_id)], args=args))
+
+    def _key(self, job_id):
+        return f"job:{job_id}"
+
+
+class InMemoryJobStore:
+    """
+    Process-local fallback used when REDIS_URL is unset (single worker only)
+
+    Expired jobs are swept at most once a minute, so memory stays bounded.
+    """
+
+    SWEEP_INTERVAL = 60  # seconds
+
+    def __init__(self):
+        self.jobs = {}
+        self.expires = {}
+        self._next_sweep = 0
+
+    async def get(self, job_id):
+        job = self._find(job_id)
+        # Hand out a copy so callers only change state through update()
+        return dict(job) if job is not None else None
+
+    async def create(self, job_id, **fields):
+        self._sweep()
+        self.jobs[job_id] = dict(fields)
+        self.expires[job_id] = time.time() + _ttl_for(fields.get("status"))
+
+    async def update(self, job_id, **fields):
+        # Returns False, writing nothing, when the job does not exist (or expired)
+        job = self._find(job_id)
+        if job is None:
+            return False
+
+        job.update(fields)
+        self.expires[job_id] = time.time() + _ttl_for(job.get("status"))
+        return True
+
+    def _find(self, job_id):
+        # Jobs past their TTL count as gone even before the next sweep removes them
+        self._sweep()
+        if self.expires.get(job_id, 0) <= time.time():
+            return None
+        return self.jobs[job_id]
+
+    def _sweep(self):
+        now = time.time()
+        if now < self._next_sweep:
+            return
+
+        self._next_sweep = now + self.SWEEP_INTERVAL
+        for job_id in [job_id for job_id, expires in self.expires.items() if expires <= now]:
+            del self.jobs[job_id]
+            del self.expires[job_id]
+
+
+def _ttl_for(status):
+    return FINISHED_JOB_TTL if status in FINISHED_STATUSES else JOB_TTL
+
+
+def create_job_store():
+    """
+    Use Redis when REDIS_URL is configured, otherwise keep jobs in process memory
+
+    Returns:
+        RedisJobStore or InMemoryJobStore
+    """
+    url = os.getenv("REDIS_URL")
+    return RedisJobStore(url) if url else InMemoryJobStore()
@@ -9,11 +9,13 @@ from pydantic import BaseModel, Field, field_validator
 from masumi.config import Config
 from masumi.payment import Payment, Amount
 from logging_config import setup_logging
-import google.generativeai as genai
+from job_store import create_job_store, FINISHED_STATUSES, JOB_TTL
 
 from rag.pdf_loader import load_pdf
-from rag.embedder import get_embedding
-from rag.vector_store import vector_store
+from rag.chunker import split_text
+from rag.embedder import configure, get_embeddings_batch
+from rag.vector_store import get_vector_store
+from rag.ask import ask
 
 
 # Configure logging
@@ -21,15 +23,12 @@ logger = setup_logging()
 
 # Load environment variables
 load_dotenv(override=True)
+configure()
 
 # Retrieve API Keys and URLs
 PAYMENT_SERVICE_URL = os.getenv("PAYMENT_SERVICE_URL")
 PAYMENT_API_KEY = os.getenv("PAYMENT_API_KEY")
 NETWORK = os.getenv("NETWORK")
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
-
-# Configure Gemini
-genai.configure(api_key=GEMINI_API_KEY)
 
 logger.info("Starting application with configuration:")
 logger.info(f"PAYMENT_SERVICE_URL: {PAYMENT_SERVICE_URL}")
@@ -43,13 +42,32 @@ app = FastAPI(
 
 # Create uploads folder
 UPLOAD_FOLDER = "uploads"
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1 MiB
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 # ─────────────────────────────────────────────────────────────────────────────
-# Temporary in-memory job store (DO NOT USE IN PRODUCTION)
+# Job store (Redis when REDIS_URL is set, shared by all workers) and the
+# process-local Payment objects, which cannot be serialized
 # ─────────────────────────────────────────────────────────────────────────────
-jobs = {}
+job_store = create_job_store()
 payment_instances = {}
+# References to pending expire_unpaid_job tasks, so they are not garbage collected
+expiry_tasks = set()
+
+def stop_payment_monitoring(job_id: str) -> None:
+    """ Stops a job's payment monitoring and drops its Payment, if this process holds one """
+    payment = payment_instances.pop(job_id, None)
+    if payment is not None:
+        payment.stop_status_monitoring()
+
+async def expire_unpaid_job(job_id: str) -> None:
+    """ Drops a job's Payment once its record has expired unpaid from the job store """
+    await asyncio.sleep(JOB_TTL)
+    job = await job_store.get(job_id)
+    # A paid job is "running" and handle_payment_status cleans up after it
+    if job is None or job["status"] == "awaiting_payment":
+        logger.info(f"Job {job_id} expired without payment, stopping payment monitoring")
+        stop_payment_monitoring(job_id)
 
 # ─────────────────────────────────────────────────────────────────────────────
 # Initialize Masumi Payment Config
@@ -88,58 +106,26 @@ async def execute_rag_task(input_data: dict) -> str:
     if not query:
         raise ValueError("Question missing from input_data")
     
-    # 1. Embed question
-    query_emb = get_embedding(query)
-    
-    # 2. Retrieve context chunks
-    context_chunks = vector_store.search(query_emb, k=5)
-    context = "\n\n".join(context_chunks)
-    
-    # 3. Ask Gemini with retrieved context
-    prompt = f"""
-You are a helpful assistant. Use ONLY the following PDF context:
-
-{context}
-
-Question: {query}
-
-Required output format and rules:
-- Return ONLY a single valid JSON object and nothing else (no markdown, no backticks, no commentary).
-- The JSON must contain exactly one key: "answer" whose value is a string.
-- The answer string MUST NOT contain newline characters (\\n), bullet characters ("*", "-", "•"), or any markdown formatting (no **, __, etc.).
-- Do NOT use currency symbols. Replace the rupee symbol '₹' with the word " ruppees" (note the leading space) so amounts look like: "6,00,000 ruppees".
-- Keep the answer concise and factual, based strictly on the provided PDF context.
-
-Return the JSON only.
-"""
-    
-    model = genai.GenerativeModel("gemini-2.5-flash")
-    response = model.generate_content(prompt)
-    
-    # Try to parse the model output as JSON. If parsing fails, sanitize the text.
-    try:
-        parsed = json.loads(response.text)
-        # Ensure the parsed object has the expected shape
-        if isinstance(parsed, dict) and "answer" in parsed:
-            return json.dumps(parsed)
-    except Exception:
-        pass
-    
-    # Fallback sanitization: remove newlines, bullets, markdown and replace rupee symbol
-    ans = response.text
-    ans = ans.replace('\n', ' ').replace('\r', ' ')
-    for ch in ['*', '•']:
-        ans = ans.replace(ch, '')
-    ans = ans.replace('-', ' ')
-    ans = ans.replace('₹', ' ruppees')
-    # Collapse multiple spaces
-    ans = ' '.join(ans.split())
-    
-    return json.dumps({"answer": ans})
+    # Embedding, retrieval and generation all block; run them off the event loop
+    result = await asyncio.to_thread(ask, query)
+    return json.dumps(result)
 
 # ─────────────────────────────────────────────────────────────────────────────
 # PDF Upload Endpoint (No Masumi Integration)
 # ─────────────────────────────────────────────────────────────────────────────
+def index_pdf(file_path: str) -> int:
+    """ Extract, chunk, embed and index a saved PDF; returns the number of chunks """
+    # 1. Extract PDF text
+    text = load_pdf(file_path)
+    
+    # 2. Chunking (paragraph/sentence-aware, with overlap)
+    chunks = split_text(text)
+    
+    # 3. Embed (batched) & store
+    embs = get_embeddings_batch(chunks)
+    get_vector_store().add_batch(embs, chunks)
+    return len(chunks)
+
 @app.post("/upload-pdf")
 async def upload_pdf(file: UploadFile = File(...)):
     """ Upload and index PDF without payment requirement """
@@ -148,23 +134,16 @@ async def upload_pdf(file: UploadFile = File(...)):
         
         # Save file
         file_path = os.path.join(UPLOAD_FOLDER, file.filename)
+        # Stream to disk in fixed-size pieces so memory stays O(chunk) for any PDF size
         with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
-        
-        # 1. Extract PDF text
-        text = load_pdf(file_path)
-        
-        # 2. Chunking (simple splitting)
-        chunks = [text[i:i+1000] for i in range(0, len(text), 1000)]
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                f.write(chunk)
         
-        # 3. Embed & store
-        for chunk in chunks:
-            emb = get_embedding(chunk)
-            vector_store.add(emb, chunk)
+        # Extraction, embedding and indexing all block; run them off the event loop
+        chunks_processed = await asyncio.to_thread(index_pdf, file_path)
         
         logger.info(f"PDF {file.filename} uploaded and indexed successfully")
-        return {"message": "PDF uploaded and indexed successfully", "chunks_processed": len(chunks)}
+        return {"message": "PDF uploaded and indexed successfully", "chunks_processed": chunks_processed}
     
     except Exception as e:
         logger.error(f"Error uploading PDF: {str(e)}", exc_info=True)
@@ -218,20 +197,25 @@ async def start_job(data: StartJobRequest):
         logger.info(f"Created payment request with blockchain identifier: {blockchain_identifier}")
 
         # Store job info (Awaiting payment)
-        jobs[job_id] = {
-            "status": "awaiting_payment",
-            "payment_status": "pending",
-            "blockchain_identifier": blockchain_identifier,
-            "input_data": data.input_data,
-            "result": None,
-            "identifier_from_purchaser": data.identifier_from_purchaser
-        }
+        await job_store.create(
+            job_id,
+            status="awaiting_payment",
+            payment_status="pending",
+            blockchain_identifier=blockchain_identifier,
+            input_data=data.input_data,
+            result=None,
+            identifier_from_purchaser=data.identifier_from_purchaser
+        )
 
         async def payment_callback(blockchain_identifier: str):
             await handle_payment_status(job_id, blockchain_identifier)
 
         # Start monitoring the payment status
         payment_instances[job_id] = payment
+        # A job that is never paid expires from the job store after JOB_TTL; drop its Payment then too
+        task = asyncio.create_task(expire_unpaid_job(job_id))
+        expiry_tasks.add(task)
+        task.add_done_callback(expiry_tasks.discard)
         logger.info(f"Starting payment status monitoring for job {job_id}")
         await payment.start_status_monitoring(payment_callback)
 
@@ -271,12 +255,16 @@ async def handle_payment_status(job_id: str, payment_id: str) -> None:
     try:
         logger.info(f"Payment {payment_id} completed for job {job_id}, executing task...")
         
-        # Update job status to running
-        jobs[job_id]["status"] = "running"
-        logger.info(f"Input data: {jobs[job_id]['input_data']}")
+        # Update job status to running; the record is gone if the job expired while awaiting payment
+        if not await job_store.update(job_id, status="running"):
+            logger.warning(f"Job {job_id} no longer exists, skipping task for payment {payment_id}")
+            stop_payment_monitoring(job_id)
+            return
+        job = await job_store.get(job_id)
+        logger.info(f"Input data: {job['input_data']}")
 
         # Execute the RAG task
-        result = await execute_rag_task(jobs[job_id]["input_data"])
+        result = await execute_rag_task(job["input_data"])
         logger.info(f"RAG task completed for job {job_id}")
         
         # Mark payment as completed on Masumi
@@ -284,41 +272,50 @@ async def handle_payment_status(job_id: str, payment_id: str) -> None:
         logger.info(f"Payment completed for job {job_id}")
 
         # Update job status
-        jobs[job_id]["status"] = "completed"
-        jobs[job_id]["payment_status"] = "completed"
-        jobs[job_id]["result"] = result
+        await job_store.update(job_id, status="completed", payment_status="completed", result=result)
 
         # Stop monitoring payment status
-        if job_id in payment_instances:
-            payment_instances[job_id].stop_status_monitoring()
-            del payment_instances[job_id]
+        stop_payment_monitoring(job_id)
     except Exception as e:
         logger.error(f"Error processing payment {payment_id} for job {job_id}: {str(e)}", exc_info=True)
-        jobs[job_id]["status"] = "failed"
-        jobs[job_id]["error"] = str(e)
+        await job_store.update(job_id, status="failed", error=str(e))
         
         # Still stop monitoring to prevent repeated failures
-        if job_id in payment_instances:
-            payment_instances[job_id].stop_status_monitoring()
-            del payment_instances[job_id]
+        stop_payment_monitoring(job_id)
 
 # ─────────────────────────────────────────────────────────────────────────────
 # 3) Check Job and Payment Status (MIP-003: /status)
 # ─────────────────────────────────────────────────────────────────────────────
+def restore_payment(job: dict) -> Payment:
+    """ Rebuilds a job's Masumi Payment from its stored record (for status checks only) """
+    payment = Payment(
+        agent_identifier=os.getenv("AGENT_IDENTIFIER"),
+        config=config,
+        identifier_from_purchaser=job["identifier_from_purchaser"],
+        input_data=job["input_data"],
+        network=NETWORK
+    )
+    payment.payment_ids.add(job["blockchain_identifier"])
+    return payment
+
 @app.get("/status")
 async def get_status(job_id: str):
     """ Retrieves the current status of a specific job """
     logger.info(f"Checking status for job {job_id}")
-    if job_id not in jobs:
+    job = await job_store.get(job_id)
+    if job is None:
         logger.warning(f"Job {job_id} not found")
         raise HTTPException(status_code=404, detail="Job not found")
 
-    job = jobs[job_id]
+    # Check latest payment status while the job is still in progress; a job
+    # started on another worker gets a Payment rebuilt from its stored record
+    payment = payment_instances.get(job_id)
+    if payment is None and job["status"] not in FINISHED_STATUSES:
+        payment = restore_payment(job)
 
-    # Check latest payment status if payment instance exists
-    if job_id in payment_instances:
+    if payment is not None:
         try:
-            status = await payment_instances[job_id].check_payment_status()
+            status = await payment.check_payment_status()
             job["payment_status"] = status.get("data", {}).get("status")
             logger.info(f"Updated payment status for job {job_id}: {job['payment_status']}")
         except ValueError as e:
@@ -327,6 +324,7 @@ async def get_status(job_id: str):
         except Exception as e:
             logger.error(f"Error checking payment status: {str(e)}", exc_info=True)
             job["payment_status"] = "error"
+        await job_store.update(job_id, payment_status=job["payment_status"])
 
     result_data = job.get("result")
     logger.info(f"Result data: {result_data}")
@@ -430,7 +428,26 @@ if __name__ == "__main__":
         print(f"Upload PDF:               http://{host}:{port}/upload-pdf\n")
         print("=" * 70 + "\n")
 
-        uvicorn.run(app, host=host, port=port, log_level="info")
+        # Jobs are only shared across workers through Redis; without it, stay single-process
+        # even when the platform sets WEB_CONCURRENCY (Heroku's buildpack does)
+        workers = int(os.environ.get("WEB_CONCURRENCY", 4))
+        if not os.getenv("REDIS_URL"):
+            if workers > 1:
+                logger.warning(f"REDIS_URL is not set; ignoring WEB_CONCURRENCY={workers} and running 1 worker")
+            workers = 1
+
+        # "auto" uses uvloop/httptools when installed; uvloop is skipped on Windows.
+        # Worker processes import the app by name; a single worker serves the app
+        # object already built here instead of importing main a second time.
+        uvicorn.run(
+            "main:app" if workers > 1 else app,
+            host=host,
+            port=port,
+            loop="auto",
+            http="auto",
+            workers=workers,
+            log_level="info"
+        )
     else:
         # Run standalone mode
         asyncio.run(main())
@@ -0,0 +1,98 @@
+import json
+import logging
+import os
+import re
+
+import google.generativeai as genai
+
+from rag.embedder import get_embedding
+from rag.query_cache import query_cache
+from rag.sanitize import sanitize_answer
+from rag.vector_store import get_vector_store
+
+logger = logging.getLogger(__name__)
+
+GENERATION_MODEL = "gemini-2.5-flash"
+# Context chunks retrieved per question, and the most context characters sent with
+# it unless RAG_CONTEXT_CHAR_BUDGET is set (read per call, so a .env value applies)
+CONTEXT_K = 5
+CONTEXT_CHAR_BUDGET = 12_000
+
+# The prompt is the prefix, each context chunk followed by a blank line, then the suffix
+PROMPT_PREFIX = """
+You are a helpful assistant. Use ONLY the following PDF context:
+
+"""
+
+PROMPT_SUFFIX = """Question: {query}
+
+Required output format and rules:
+- Return ONLY a single valid JSON object and nothing else (no markdown, no backticks, no commentary).
+- The JSON must contain exactly one key: "answer" whose value is a string.
+- The answer string MUST NOT contain newline characters (\\n), bullet characters ("*", "-", "•"), or any markdown formatting (no **, __, etc.).
+- Do NOT use currency symbols. Replace the rupee symbol '₹' with the word " ruppees" (note the leading space) so amounts look like: "6,00,000 ruppees".
+- Keep the answer concise and factual, based strictly on the provided PDF context.
+
+Return the JSON only.
+"""
+
+# Outermost {...} in the response, so ```json fences or stray prose around it are ignored
+_JSON_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+# Built once at import and reused for every question; its API client is only
+# created on the first request, after the entry point has called configure()
+model = genai.GenerativeModel(GENERATION_MODEL)
+
+def build_prompt(context_chunks, query, budget=None):
+    if budget is None:
+        budget = int(os.getenv("RAG_CONTEXT_CHAR_BUDGET", CONTEXT_CHAR_BUDGET))
+    # Assemble every piece once and join at the end, instead of joining the
+    # context and then copying it again into a formatted template. Chunks arrive
+    # best-first, so the budget cuts the least relevant context.
+    parts = [PROMPT_PREFIX]
+    for chunk in context_chunks:
+        if budget <= 0:
+            break
+        chunk = chunk[:budget]
+        budget -= len(chunk)
+        parts.append(chunk)
+        parts.append("\n\n")
+    parts.append(PROMPT_SUFFIX.format(query=query))
+    return "".join(parts)
+
+def parse_answer(text):
+    # Try to parse the model output as JSON. If parsing fails, sanitize the text.
+    match = _JSON_RE.search(text)
+    try:
+        parsed = json.loads(match.group(0)) if match else None
+        # Ensure the parsed object has the expected shape
+        if isinstance(parsed, dict) and "answer" in parsed:
+            return parsed
+    except Exception:
+        pass
+
+    # Fallback sanitization: remove newlines, bullets, markdown and replace rupee symbol
+    return {"answer": sanitize_answer(text)}
+
+def ask(query):
+    # 1. Embed question
+    query_emb = get_embedding(query)
+
+    # Answer repeated/paraphrased questions from the semantic cache, as long as
+    # no documents were indexed since the cached answer was generated
+    vector_store = get_vector_store()
+    generation = vector_store.current_generation()
+    cached = query_cache.lookup(query_emb, generation)
+    if cached is not None:
+        logger.info("Answering from semantic query cache")
+        return cached
+
+    # 2. Retrieve context chunks
+    context_chunks = vector_store.search(query_emb, k=CONTEXT_K)
+
+    # 3. Ask Gemini with retrieved context
+    response = model.generate_content(build_prompt(context_chunks, query))
+
+    result = parse_answer(response.text)
+    query_cache.insert(query_emb, result, generation)
+    return result
@@ -0,0 +1,35 @@
+# Target chunk length and how much of each chunk's tail the next one repeats
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+# Preferred break points, coarsest first
+SEPARATORS = ["\n\n", "\n", ". ", " "]
+
+def split_text(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = min(start + chunk_size, len(text))
+        if end < len(text):
+            end = _find_break(text, start, end, chunk_size)
+
+        chunk = text[start:end].strip()
+        if chunk:
+            chunks.append(chunk)
+        if end >= len(text):
+            break
+
+        # Start the next chunk on a word boundary inside the overlap window
+        overlap_start = max(end - chunk_overlap, start + 1)
+        space = text.find(" ", overlap_start, end)
+        start = space + 1 if space != -1 else overlap_start
+    return chunks
+
+def _find_break(text, start, end, chunk_size):
+    # Cut at the coarsest separator in the last fifth of the window, so chunks
+    # end on paragraph/sentence/word boundaries without getting much shorter
+    min_end = max(end - chunk_size // 5, start + 1)
+    for sep in SEPARATORS:
+        i = text.rfind(sep, min_end, end)
+        if i != -1:
+            return i + len(sep)
+    return end
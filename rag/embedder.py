@@ -1,11 +1,98 @@
+import functools
 import google.generativeai as genai
+import numpy as np
 import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from blake3 import blake3
+from diskcache import Cache
+from google.api_core.exceptions import ResourceExhausted
 
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+def configure():
+    # The one place Gemini is configured. Entry points call it after their own
+    # load_dotenv(), so they decide whether .env overrides the shell environment.
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
 
+EMBEDDING_MODEL = "models/text-embedding-004"
+# Keep each embed_content request under the API's per-request size limit
+EMBED_BATCH_SIZE = 100
+# Sub-batch requests in flight at once, and attempts per request on HTTP 429
+EMBED_MAX_WORKERS = 16
+EMBED_MAX_RETRIES = 5
+
+# Content-addressed, on-disk cache of embeddings: same text + model, same vector
+EMBED_CACHE_DIR = "./.embcache"
+_cache = Cache(EMBED_CACHE_DIR)
+
+def _cache_key(text):
+    return blake3(EMBEDDING_MODEL.encode() + b"\0" + text.encode()).hexdigest()
+
+def _cache_get(key):
+    cached = _cache.get(key)
+    if cached is None:
+        return None
+    # Zero-copy view over the cached bytes
+    return np.frombuffer(cached, dtype=np.float32)
+
+def _cache_set(key, emb):
+    _cache.set(key, emb.tobytes())
+
+def cached_embedding(fn):
+    # Only cache misses reach Gemini; hits and misses both come back as float32 arrays
+    @functools.wraps(fn)
+    def wrapper(text):
+        key = _cache_key(text)
+        emb = _cache_get(key)
+        if emb is None:
+            emb = np.asarray(fn(text), dtype=np.float32)
+            _cache_set(key, emb)
+        return emb
+    return wrapper
+
+def _embed_content(content):
+    # Back off exponentially (with jitter) while Gemini rate-limits the key
+    for attempt in range(EMBED_MAX_RETRIES):
+        try:
+            return genai.embed_content(
+                model=EMBEDDING_MODEL,
+                content=content
+            )["embedding"]
+        except ResourceExhausted:
+            if attempt == EMBED_MAX_RETRIES - 1:
+                raise
+            time.sleep(2 ** attempt + random.random())
+
+@cached_embedding
 def get_embedding(text):
-    model = genai.embed_content(
-        model="models/text-embedding-004",
-        content=text
-    )
-    return model["embedding"]
+    return _embed_content(text)
+
+def _embed_batch_uncached(texts):
+    # One request per EMBED_BATCH_SIZE texts instead of one per text; the
+    # requests are network-bound, so overlap them on a thread pool
+    batches = [texts[start:start + EMBED_BATCH_SIZE]
+               for start in range(0, len(texts), EMBED_BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=min(EMBED_MAX_WORKERS, len(batches))) as ex:
+        # A list input returns a list of embeddings; map keeps batch order
+        return [emb for batch in ex.map(_embed_content, batches) for emb in batch]
+
+def get_embeddings_batch(texts):
+    keys = [_cache_key(text) for text in texts]
+    embeddings = [_cache_get(key) for key in keys]
+
+    # Send each distinct uncached text to Gemini once, then splice results back
+    misses = {}
+    for i, (key, emb) in enumerate(zip(keys, embeddings)):
+        if emb is None:
+            misses.setdefault(key, []).append(i)
+
+    if misses:
+        miss_texts = [texts[positions[0]] for positions in misses.values()]
+        for (key, positions), emb in zip(misses.items(), _embed_batch_uncached(miss_texts)):
+            emb = np.asarray(emb, dtype=np.float32)
+            _cache_set(key, emb)
+            for i in positions:
+                embeddings[i] = emb
+
+    # A single (n, dim) float32 matrix, ready for VectorStore.add_batch
+    return np.array(embeddings, dtype=np.float32)
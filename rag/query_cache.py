@@ -0,0 +1,84 @@
+import bisect
+import threading
+import time
+
+import faiss
+import numpy as np
+
+from rag.vector_store import EMBEDDING_DIM, normalize
+
+# Minimum cosine similarity for a cached question to count as the same question
+QUERY_CACHE_THRESHOLD = 0.95
+QUERY_CACHE_TTL = 24 * 60 * 60  # seconds
+QUERY_CACHE_MAX_ENTRIES = 10_000
+
+
+class QueryCache:
+    """Semantic cache mapping question embeddings to previously generated answers."""
+
+    def __init__(self, threshold=QUERY_CACHE_THRESHOLD, ttl=QUERY_CACHE_TTL,
+                 max_entries=QUERY_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # Questions are answered from worker threads concurrently
+        self._lock = threading.Lock()
+        # Vector store generation the cached answers were built from
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self.index = faiss.IndexFlatIP(EMBEDDING_DIM)
+        self.answers = []
+        self.expires = []
+
+    def _sync(self, generation):
+        # Answers depend on the indexed documents, so a newer vector store
+        # generation (possibly written by another process) drops every entry.
+        # Returns False for callers still working from an older generation.
+        if generation > self.generation:
+            self._reset()
+            self.generation = generation
+        return generation == self.generation
+
+    def lookup(self, query_emb, generation):
+        query_emb = normalize(query_emb)
+        with self._lock:
+            if not self._sync(generation) or self.index.ntotal == 0:
+                return None
+
+            scores, indices = self.index.search(query_emb, 1)
+            i = indices[0][0]
+            if i < 0 or scores[0][0] < self.threshold or self.expires[i] <= time.time():
+                return None
+
+            return self.answers[i]
+
+    def insert(self, query_emb, answer, generation):
+        query_emb = normalize(query_emb)
+        with self._lock:
+            if not self._sync(generation):
+                return
+
+            self._evict()
+            self.index.add(query_emb)
+            self.answers.append(answer)
+            self.expires.append(time.time() + self.ttl)
+
+    def _evict(self):
+        # Entries share one TTL, so expired ones are always the oldest prefix
+        drop = bisect.bisect_right(self.expires, time.time())
+        drop = max(drop, len(self.answers) - self.max_entries + 1)
+        if drop <= 0:
+            return
+
+        self.index.remove_ids(np.arange(drop, dtype="int64"))
+        del self.answers[:drop]
+        del self.expires[:drop]
+
+
+query_cache = QueryCache()
@@ -0,0 +1,14 @@
+# Newlines become spaces, bullets/markdown are dropped, hyphens become spaces
+# and the rupee symbol is spelled out, all in a single str.translate pass
+_ANSWER_TRANS = str.maketrans({
+    '\n': ' ',
+    '\r': ' ',
+    '*': None,
+    '•': None,
+    '-': ' ',
+    '₹': ' ruppees',
+})
+
+def sanitize_answer(text):
+    # Fallback for model output that is not the requested JSON object
+    return ' '.join(text.translate(_ANSWER_TRANS).split())
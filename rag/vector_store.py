@@ -1,28 +1,394 @@
+import logging
+import os
+import pickle
+import threading
+import time
+from contextlib import contextmanager
+
 import faiss
 import numpy as np
 
+try:
+    import fcntl
+except ImportError:  # Windows: msvcrt only offers exclusive locks
+    fcntl = None
+    import msvcrt
+
+try:
+    import simsimd
+except ImportError:  # fall back to a numpy matmul for the exact scan
+    simsimd = None
+
+logger = logging.getLogger(__name__)
+
+# Gemini text-embedding-004 outputs 768 dim vectors
+EMBEDDING_DIM = 768
+
+# Index files are saved as <INDEX_PATH>.<generation>, named by the chunks file
+INDEX_PATH = os.path.join("uploads", "index.faiss")
+CHUNKS_PATH = os.path.join("uploads", "chunks.pkl")
+
+# IVF-PQ settings: 96 sub-quantizers x 8 bits = 96 bytes per vector
+IVF_NLIST = 1024
+PQ_M = 96
+PQ_NBITS = 8
+IVF_NPROBE = 16
+# Below this many vectors, search is an exact SIMD scan over a float32 matrix
+SMALL_INDEX_SIZE = 10_000
+# Vectors collected before a quantized index is trained; until then the exact
+# scan serves every search. k-means needs ~39 points per IVF centroid.
+TRAIN_SIZES = {"ivfpq": 39 * IVF_NLIST, "sq8": 1_000}
+# PQ candidates re-scored against the float16 copies when rerank is on
+RERANK_CANDIDATES = 200
+
+
+def normalize(embs):
+    # Scale each row by its reciprocal norm once, at insert/query time, so every
+    # stored comparison afterwards is a single dot product (cosine similarity).
+    # asarray is a no-copy view for float32 input; the scaled result is the one
+    # new (n, 768) array, so the caller's data is never modified.
+    embs = np.asarray(embs, dtype=np.float32)
+    if embs.ndim == 1:
+        embs = embs[None, :]
+    recip = 1.0 / np.linalg.norm(embs, axis=1, keepdims=True).clip(min=1e-12)
+    return np.ascontiguousarray(embs * recip)
+
+
 class VectorStore:
-    def __init__(self):
-        # Gemini text-embedding-004 outputs 768 dim vectors
-        self.index = faiss.IndexFlatL2(768)
+    def __init__(self, index_type="hnsw", rerank=False, index_path=None, chunks_path=None):
+        # "hnsw" for sub-linear ANN search, "flat" for an exact scan (tests),
+        # "ivfpq" for product-quantized storage on large corpora, "sq8" for
+        # int8 scalar-quantized storage (4x smaller than float32).
+        # Vectors are L2-normalized so inner product ranks by cosine similarity.
+        self.index_type = index_type
+        self.rerank = rerank
+        self.index = self._build_index(index_type)
         self.chunks = []
+        # Contiguous copy of every vector while the store is small; it serves
+        # exact searches and is the training set for quantized indexes
+        self.matrix = np.empty((0, EMBEDDING_DIM), dtype="float32")
+        # float16 copies of every vector, only kept when rerank is on
+        self.vectors = np.empty((0, EMBEDDING_DIM), dtype="float16")
+        # Bumped on every add; persisted, so all processes agree on the version
+        self.generation = 0
+        # Callers run searches and uploads from worker threads concurrently
+        self._lock = threading.Lock()
+
+        # With paths set, every add_batch is written to disk and other
+        # processes sharing the files pick the change up on their next call
+        self.index_path = index_path
+        self.chunks_path = chunks_path
+        self._loaded_version = None
+        self._mmapped = False
+        # Rows of each array already in its on-disk file, as of the last load/save
+        self._saved_rows = {"matrix": 0, "vectors": 0}
+        if self._persistent():
+            with self._file_lock(exclusive=False):
+                self._refresh()
+
+    def _build_index(self, index_type):
+        if index_type == "flat":
+            return faiss.IndexFlatIP(EMBEDDING_DIM)
+
+        if index_type == "hnsw":
+            index = faiss.IndexHNSWFlat(EMBEDDING_DIM, 32, faiss.METRIC_INNER_PRODUCT)
+            index.hnsw.efConstruction = 200
+            index.hnsw.efSearch = 64
+            return index
+
+        if index_type == "ivfpq":
+            quantizer = faiss.IndexFlatIP(EMBEDDING_DIM)
+            # Encodes residuals against the coarse centroids (by_residual)
+            index = faiss.IndexIVFPQ(
+                quantizer, EMBEDDING_DIM, IVF_NLIST, PQ_M, PQ_NBITS,
+                faiss.METRIC_INNER_PRODUCT
+            )
+            index.nprobe = IVF_NPROBE
+            return index
+
+        if index_type == "sq8":
+            # One int8 code per component, scaled by per-dimension ranges
+            # learned at train time; distances are computed on the codes
+            return faiss.IndexScalarQuantizer(
+                EMBEDDING_DIM, faiss.ScalarQuantizer.QT_8bit,
+                faiss.METRIC_INNER_PRODUCT
+            )
+
+        raise ValueError(f"Unknown index type: {index_type}")
 
     def add(self, emb, chunk):
-        emb = np.array(emb).reshape(1, -1).astype("float32")
-        self.index.add(emb)
-        self.chunks.append(chunk)
+        self.add_batch(emb, [chunk])
+
+    def add_batch(self, embs, chunks):
+        if len(chunks) == 0:
+            return
+
+        # One (n, 768) matrix and a single index.add call for the whole batch
+        embs = normalize(embs)
+
+        with self._lock:
+            if not self._persistent():
+                self._add_normalized(embs, chunks)
+                return
+
+            # Exclusive across processes: catch up with other writers, append, save
+            with self._file_lock(exclusive=True):
+                self._refresh(writable=True)
+                self._add_normalized(embs, chunks)
+                self._save()
+
+    def _add_normalized(self, embs, chunks):
+        if self.rerank:
+            self.vectors = np.vstack([self.vectors, embs.astype("float16")])
+
+        if self.matrix is not None:
+            self.matrix = np.vstack([self.matrix, embs])
+
+        if self.index.is_trained:
+            self.index.add(embs)
+        elif len(self.matrix) >= TRAIN_SIZES[self.index_type]:
+            # Train once on everything seen so far, then add it in insertion order
+            self.index.train(self.matrix)
+            self.index.add(self.matrix)
+
+        self.chunks.extend(chunks)
+        self.generation += 1
+
+        if self.matrix is not None and len(self.matrix) >= SMALL_INDEX_SIZE and self.index.is_trained:
+            # Large enough for the ANN index to win; stop keeping exact copies
+            self.matrix = None
 
     def search(self, query_emb, k=3):
-        if self.index.ntotal == 0:
+        query_emb = normalize(query_emb)
+
+        with self._lock:
+            if self._persistent():
+                with self._file_lock(exclusive=False):
+                    self._refresh()
+            return self._search_normalized(query_emb, k)
+
+    def current_generation(self):
+        # Bumped by every add_batch, including those made by other processes
+        with self._lock:
+            if self._persistent():
+                with self._file_lock(exclusive=False):
+                    self._refresh()
+            return self.generation
+
+    def _search_normalized(self, query_emb, k):
+        if len(self.chunks) == 0:
             return []
 
-        query_emb = np.array(query_emb).reshape(1, -1).astype("float32")
-        distances, indices = self.index.search(query_emb, k)
+        if self.matrix is not None:
+            return [self.chunks[i] for i in self._exact_search(query_emb, k)]
+
+        # Scores are cosine similarities, already sorted best-first
+        fetch_k = max(k, RERANK_CANDIDATES) if self.rerank else k
+        scores, indices = self.index.search(query_emb, fetch_k)
+
+        # FAISS pads missing results with -1 when fewer than k are found
+        valid_indices = [i for i in indices[0] if 0 <= i < len(self.chunks)]
+
+        if self.rerank and valid_indices:
+            exact = self.vectors[valid_indices].astype("float32") @ query_emb[0]
+            valid_indices = [valid_indices[j] for j in np.argsort(-exact)[:k]]
 
-        valid_indices = [i for i in indices[0] if i < len(self.chunks)]
         results = [self.chunks[i] for i in valid_indices]
 
         return results
 
+    def _exact_search(self, query_emb, k):
+        # All similarities in one vectorized sweep, then a partial sort for top-k.
+        # Rows and query are unit length, so the dot product is the cosine.
+        if simsimd is not None:
+            scores = np.asarray(simsimd.cdist(query_emb, self.matrix, metric="dot"))[0]
+        else:
+            scores = self.matrix @ query_emb[0]
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def _persistent(self):
+        return self.index_path is not None and self.chunks_path is not None
+
+    @contextmanager
+    def _file_lock(self, exclusive):
+        # Readers share the lock; a writer holds it alone while swapping files
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        with open(self.index_path + ".lock", "a+") as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+                return
+
+            # Without shared locks, readers lock exclusively too
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except OSError:
+                    time.sleep(0.05)
+            try:
+                yield
+            finally:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _refresh(self, writable=False):
+        # The chunks file names the index file it belongs to, so it versions the pair
+        if not os.path.exists(self.chunks_path):
+            return
+
+        version = self._file_version()
+        # mmapped indexes are read-only; load a private copy to add to
+        if version != self._loaded_version or (writable and self._mmapped):
+            self._load(mmap=not writable)
+            self._loaded_version = version
+
+    def _save(self):
+        # Persist the built index so it is not rebuilt on every process start.
+        # Each generation's index goes to its own file and the chunks file,
+        # which names it, is renamed into place last: that rename is the single
+        # commit point, so a crash at any step leaves a matching pair on disk.
+        index_file = self._index_file(self.generation)
+        faiss.write_index(self.index, index_file + ".tmp")
+        os.replace(index_file + ".tmp", index_file)
+
+        # The float arrays go to append-only raw files rather than the pickle,
+        # so each save writes only the new rows. Row counts are committed with
+        # the chunks file; rows past them are leftovers of an interrupted save.
+        # flat and hnsw rebuild the matrix from the index, so it is not written.
+        saved_matrix = self.matrix is not None and self.index_type in TRAIN_SIZES
+        if saved_matrix:
+            self._append_rows("matrix", self.matrix)
+        if self.rerank:
+            self._append_rows("vectors", self.vectors)
+
+        with open(self.chunks_path + ".tmp", "wb") as f:
+            pickle.dump({
+                "index_type": self.index_type,
+                "rerank": self.rerank,
+                "generation": self.generation,
+                "chunks": self.chunks,
+                "matrix_rows": None if self.matrix is None else len(self.matrix),
+            }, f)
+        os.replace(self.chunks_path + ".tmp", self.chunks_path)
+        self._loaded_version = self._file_version()
+        self._remove_stale_index_files()
+        if self.matrix is None and os.path.exists(self._array_file("matrix")):
+            try:
+                os.remove(self._array_file("matrix"))
+            except OSError:
+                pass
+
+    def _array_file(self, name):
+        return f"{self.index_path}.{name}"
+
+    def _append_rows(self, name, array):
+        path = self._array_file(name)
+        saved = self._saved_rows[name]
+        with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+            f.truncate(saved * array.shape[1] * array.itemsize)
+            f.seek(0, os.SEEK_END)
+            f.write(np.ascontiguousarray(array[saved:]).tobytes())
+        self._saved_rows[name] = len(array)
+
+    def _read_rows(self, name, dtype, rows, mmap):
+        if rows == 0:
+            return np.empty((0, EMBEDDING_DIM), dtype=dtype)
+        if mmap:
+            return np.memmap(self._array_file(name), dtype=dtype, mode="r",
+                             shape=(rows, EMBEDDING_DIM))
+        return np.fromfile(self._array_file(name), dtype=dtype,
+                           count=rows * EMBEDDING_DIM).reshape(rows, EMBEDDING_DIM)
+
+    def _index_file(self, generation):
+        return f"{self.index_path}.{generation}"
+
+    def _remove_stale_index_files(self):
+        directory = os.path.dirname(self.index_path) or "."
+        prefix = os.path.basename(self.index_path) + "."
+        for name in os.listdir(directory):
+            suffix = name[len(prefix):]
+            if name.startswith(prefix) and suffix.isdigit() and int(suffix) != self.generation:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    # Still open elsewhere (Windows); retried on the next save
+                    pass
+
+    def _file_version(self):
+        # os.replace gives every save a new inode, even within one mtime tick
+        stat = os.stat(self.chunks_path)
+        return (stat.st_ino, stat.st_mtime_ns)
+
+    def _load(self, mmap=True):
+        with open(self.chunks_path, "rb") as f:
+            state = pickle.load(f)
+        # The saved vectors are only searchable with the index they were built
+        # for, so the files on disk win over what this store was created with
+        if (state["index_type"], state["rerank"]) != (self.index_type, self.rerank):
+            logger.warning(
+                f"{self.chunks_path} was built with index_type={state['index_type']!r}, "
+                f"rerank={state['rerank']}; ignoring index_type={self.index_type!r}, "
+                f"rerank={self.rerank}. Delete the saved index files to rebuild with new settings."
+            )
+        self.index_type = state["index_type"]
+        self.rerank = state["rerank"]
+        self.generation = state["generation"]
+        self.chunks = state["chunks"]
+
+        # Map the index file instead of reading it, so only touched pages use RAM.
+        # IO_FLAG_MMAP only covers IVF inverted lists; IO_FLAG_MMAP_IFC also maps
+        # the flat code storage that flat, hnsw and sq8 keep their vectors in.
+        flags = 0
+        if mmap:
+            flags = faiss.IO_FLAG_MMAP
+            if self.index_type != "ivfpq":
+                flags |= faiss.IO_FLAG_MMAP_IFC
+        self.index = faiss.read_index(self._index_file(self.generation), flags)
+        self._mmapped = mmap
+
+        # FAISS ids are positions in self.chunks; refuse to serve a mismatched pair
+        indexed = len(self.chunks) if self.index.is_trained else 0
+        if self.index.ntotal != indexed:
+            raise ValueError(
+                f"Vector index {self._index_file(self.generation)} holds {self.index.ntotal} "
+                f"vectors but {self.chunks_path} expects {indexed}"
+            )
+
+        # flat and hnsw store the exact vectors, so the matrix comes from the index
+        matrix_rows = state["matrix_rows"]
+        if matrix_rows is None:
+            self.matrix = None
+        elif self.index_type in TRAIN_SIZES:
+            self.matrix = self._read_rows("matrix", "float32", matrix_rows, mmap)
+        else:
+            self.matrix = self.index.reconstruct_n(0, matrix_rows)
+        vector_rows = len(self.chunks) if self.rerank else 0
+        self.vectors = self._read_rows("vectors", "float16", vector_rows, mmap)
+        self._saved_rows = {"matrix": matrix_rows or 0, "vectors": vector_rows}
+
+
+_vector_store = None
+_vector_store_lock = threading.Lock()
+
 
-vector_store = VectorStore()
+def get_vector_store():
+    # Built on first use rather than at import, so VECTOR_INDEX and
+    # VECTOR_RERANK are read after the entry point has loaded .env
+    global _vector_store
+    with _vector_store_lock:
+        if _vector_store is None:
+            _vector_store = VectorStore(
+                index_type=os.getenv("VECTOR_INDEX", "hnsw"),
+                rerank=os.getenv("VECTOR_RERANK", "false").lower() == "true",
+                index_path=INDEX_PATH,
+                chunks_path=CHUNKS_PATH
+            )
+        return _vector_store
@@ -0,0 +1,70 @@
+"""
+Chunker Test Script
+-------------------
+This script checks where rag.chunker.split_text places chunk boundaries.
+It runs offline: no service, API keys or PDF needed.
+"""
+
+import re
+
+from rag.chunker import split_text
+
+# Colors for terminal output
+class Colors:
+    GREEN = '\033[92m'
+    RED = '\033[91m'
+    END = '\033[0m'
+    BOLD = '\033[1m'
+
+def test_blank_and_short_text():
+    """Blank text gives no chunks; short text is one stripped chunk"""
+    assert split_text("") == []
+    assert split_text("   \n\n  ") == []
+    assert split_text("  Only one line.  ") == ["Only one line."]
+
+def test_text_without_spaces():
+    """With no separator to cut at, chunks are hard cuts stepping by size - overlap"""
+    text = "".join(chr(ord("a") + i % 26) for i in range(2500))
+    chunks = split_text(text, chunk_size=1000, chunk_overlap=150)
+    assert chunks == [text[0:1000], text[850:1850], text[1700:2500]]
+
+def test_paragraph_boundary():
+    """A paragraph break in the last fifth of the window ends the chunk"""
+    paragraphs = ["Alpha " * 75, "Beta " * 90, "Gamma " * 75]
+    paragraphs = [p.strip() for p in paragraphs]
+    chunks = split_text("\n\n".join(paragraphs), chunk_size=1000, chunk_overlap=150)
+    assert chunks[0] == paragraphs[0] + "\n\n" + paragraphs[1]
+
+def test_words_and_overlap():
+    """Chunks start and end on whole words, and each repeats the previous one's tail"""
+    words = [f"w{i:03d}" for i in range(600)]
+    chunks = split_text(" ".join(words), chunk_size=1000, chunk_overlap=150)
+    assert len(chunks) > 1
+    for prev, chunk in zip(chunks, chunks[1:]):
+        assert len(prev) <= 1000
+        assert all(re.fullmatch(r"w\d{3}", w) for w in chunk.split(" "))
+        # The next chunk begins inside the previous one, within the overlap
+        first = chunk.split(" ")[0]
+        assert first in prev[-150:]
+    assert chunks[-1].endswith(words[-1])
+
+def main():
+    """Run every check and report the failures"""
+    import sys
+
+    checks = [test_blank_and_short_text, test_text_without_spaces,
+              test_paragraph_boundary, test_words_and_overlap]
+    failed = 0
+    print(f"\n{Colors.BOLD}Chunker Tests{Colors.END}\n")
+    for check in checks:
+        try:
+            check()
+            print(f"{Colors.GREEN}✓ {check.__doc__}{Colors.END}")
+        except AssertionError:
+            failed += 1
+            print(f"{Colors.RED}✗ {check.__doc__}{Colors.END}")
+    print()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
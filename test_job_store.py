@@ -0,0 +1,115 @@
+"""
+Job Store Test Script
+---------------------
+This script checks InMemoryJobStore TTL handling: expired jobs read as missing,
+update() never recreates them, and the periodic sweep frees their memory.
+It runs offline: no service or Redis needed.
+"""
+
+import asyncio
+
+import job_store
+from job_store import FINISHED_JOB_TTL, JOB_TTL, InMemoryJobStore
+
+# Colors for terminal output
+class Colors:
+    GREEN = '\033[92m'
+    RED = '\033[91m'
+    END = '\033[0m'
+    BOLD = '\033[1m'
+
+class FakeClock:
+    """Stands in for the time module inside job_store so TTLs pass instantly"""
+
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def time(self):
+        return self.now
+
+def with_fake_clock(check):
+    """Runs an async check against a fresh store with job_store.time patched"""
+    def run():
+        clock = FakeClock()
+        real_time, job_store.time = job_store.time, clock
+        try:
+            asyncio.run(check(InMemoryJobStore(), clock))
+        finally:
+            job_store.time = real_time
+    run.__name__ = check.__name__
+    run.__doc__ = check.__doc__
+    return run
+
+@with_fake_clock
+async def test_update_missing_job(store, clock):
+    """update() on an unknown job returns False and creates nothing"""
+    assert await store.update("missing", status="running") is False
+    assert await store.get("missing") is None
+    assert "missing" not in store.jobs
+
+@with_fake_clock
+async def test_get_returns_copy(store, clock):
+    """get() hands out a copy; only update() changes the stored job"""
+    await store.create("job", status="awaiting_payment", input_data={"question": "q"})
+    job = await store.get("job")
+    job["status"] = "changed"
+    assert (await store.get("job"))["status"] == "awaiting_payment"
+    assert await store.update("job", status="running") is True
+    assert (await store.get("job"))["status"] == "running"
+
+@with_fake_clock
+async def test_active_job_expires(store, clock):
+    """An active job reads as missing after JOB_TTL, even before the sweep"""
+    await store.create("job", status="awaiting_payment")
+    clock.now += JOB_TTL - 1
+    assert await store.get("job") is not None
+
+    clock.now += 1
+    assert await store.get("job") is None
+    assert await store.update("job", payment_status="completed") is False
+    assert await store.get("job") is None
+
+@with_fake_clock
+async def test_finished_job_ttl(store, clock):
+    """Finishing a job shortens its TTL to FINISHED_JOB_TTL"""
+    await store.create("job", status="running")
+    await store.update("job", status="completed", result="answer")
+    clock.now += FINISHED_JOB_TTL
+    assert await store.get("job") is None
+
+@with_fake_clock
+async def test_sweep_frees_expired_jobs(store, clock):
+    """The sweep drops expired records at most once per SWEEP_INTERVAL"""
+    await store.create("old", status="awaiting_payment")
+    clock.now += JOB_TTL - 10
+    await store.create("new", status="awaiting_payment")  # sweeps; "old" is still live
+
+    clock.now += 10
+    assert await store.get("old") is None
+    assert "old" in store.jobs  # expired, but the next sweep is not due yet
+
+    clock.now += InMemoryJobStore.SWEEP_INTERVAL
+    await store.get("new")
+    assert "old" not in store.jobs and "old" not in store.expires
+    assert "new" in store.jobs
+
+def main():
+    """Run every check and report the failures"""
+    import sys
+
+    checks = [test_update_missing_job, test_get_returns_copy, test_active_job_expires,
+              test_finished_job_ttl, test_sweep_frees_expired_jobs]
+    failed = 0
+    print(f"\n{Colors.BOLD}Job Store Tests{Colors.END}\n")
+    for check in checks:
+        try:
+            check()
+            print(f"{Colors.GREEN}✓ {check.__doc__}{Colors.END}")
+        except AssertionError:
+            failed += 1
+            print(f"{Colors.RED}✗ {check.__doc__}{Colors.END}")
+    print()
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()